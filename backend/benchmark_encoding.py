@@ -0,0 +1,130 @@
+"""
+Measures response sizes and encode/compress times of the listing endpoints.
+
+Builds a synthetic 500-dialog list and 100-message page (mixed text lengths, media, polls and
+avatar URLs, fixed random seed) and runs them through encode_listing for every combination of
+JSON / MessagePack and identity / gzip / br. The "before" rows time the previous serializer
+(FastAPI's jsonable_encoder + json.dumps). Prints a Markdown table of medians.
+
+No Telegram connection is needed. Usage (from the backend directory):
+    python benchmark_encoding.py [--runs 30]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import time
+
+# main.py refuses to import without credentials; none are used here.
+os.environ.setdefault("TELEGRAM_API_ID", "0")
+os.environ.setdefault("TELEGRAM_API_HASH", "benchmark")
+os.environ.setdefault("PHONE_NUMBER", "+0")
+
+from fastapi.encoders import jsonable_encoder
+from starlette.requests import Request
+
+from main import DialogItem, MessageItem, PollDetails, PollOptionItem, encode_listing
+
+WORDS = (
+    "the of and a to in is you that it he was for on are as with his they at be this have from or one had by word "
+    "but not what all were we when your can said there use an each which she do how their if will up other about out "
+    "many then them these so some her would make like him into time has look two more write go see number no way could "
+    "people my than first water been call who oil its now find long down day did get come made may part"
+).split()
+FILE_ID_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+
+def sentence(words: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(words)).capitalize()
+
+def avatar_url(peer_id: int) -> str:
+    return f"/api/avatar/{peer_id}?v=AQADAgAD{random.getrandbits(64):x}"
+
+def make_dialogs(count: int):
+    types = ["private", "channel", "supergroup", "group", "bot"]
+    return [
+        DialogItem(
+            id=random.choice([1, -100]) * random.randint(10**8, 10**12),
+            title=sentence(random.randint(1, 4)),
+            type=random.choice(types),
+            avatar_url=avatar_url(i) if random.random() < 0.7 else None,
+        )
+        for i in range(count)
+    ]
+
+def make_messages(count: int):
+    senders = [sentence(2) for _ in range(12)]
+    messages = []
+    for i in range(count):
+        media = random.choice([None, None, "photo", "video", "document", "poll"])
+        message = MessageItem(
+            id=100000 - i,
+            text=sentence(random.randint(3, 80)) if media != "poll" else None,
+            sender=random.choice(senders),
+            date=1714000000 - i * 600,
+            media_type=media,
+            is_outgoing=False,
+            sender_avatar_url=avatar_url(random.randint(1, 12)),
+        )
+        if media in ("photo", "video", "document"):
+            message.file_id = "AgACAgIAAxkBAAI" + "".join(random.choice(FILE_ID_ALPHABET) for _ in range(60))
+            if media != "photo":
+                message.file_name, message.mime_type = f"file_{i}.mp4", "video/mp4"
+        if media == "poll":
+            message.poll_data = PollDetails(
+                question=sentence(6),
+                options=[PollOptionItem(text=sentence(2), data=str(k).encode()) for k in range(4)],
+                total_voters=random.randint(0, 5000),
+                is_closed=False,
+                is_anonymous=True,
+                type="regular",
+                allows_multiple_answers=False,
+            )
+        messages.append(message)
+    return messages
+
+def make_request(accept: str, accept_encoding: str) -> Request:
+    headers = [(b"accept", accept.encode()), (b"accept-encoding", accept_encoding.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/benchmark", "headers": headers, "query_string": b""})
+
+async def measure(items, accept: str, accept_encoding: str, runs: int):
+    sizes, encode_ms, compress_ms = [], [], []
+    for _ in range(runs):
+        response = await encode_listing(make_request(accept, accept_encoding), items)
+        timings = dict(part.split(";dur=") for part in response.headers["server-timing"].split(", "))
+        sizes.append(len(response.body))
+        encode_ms.append(float(timings["encode"]))
+        compress_ms.append(float(timings["compress"]) if "compress" in timings else None)
+    compress = "–" if compress_ms[0] is None else f"{statistics.median(compress_ms):.2f}"
+    return sizes[0], f"{statistics.median(encode_ms):.2f}", compress
+
+def measure_before(items, runs: int):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = json.dumps(jsonable_encoder(items), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        timings.append((time.perf_counter() - started) * 1000)
+    return len(body), f"{statistics.median(timings):.2f}"
+
+async def run(runs: int):
+    random.seed(1)
+    payloads = [("500 dialogs", make_dialogs(500)), ("100 messages", make_messages(100))]
+    print(f"Median of {runs} runs.\n")
+    print("| Payload | Format | Encoding | Bytes | Encode ms | Compress ms |")
+    print("|---|---|---|---|---|---|")
+    for label, items in payloads:
+        size, encode = measure_before(items, runs)
+        print(f"| {label} | JSON (before: `jsonable_encoder`) | identity | {size} | {encode} | – |")
+        for format_label, accept in [("JSON", "application/json"), ("MessagePack", "application/msgpack")]:
+            for accept_encoding in ["identity", "gzip", "br"]:
+                size, encode, compress = await measure(items, accept, accept_encoding, runs)
+                print(f"| {label} | {format_label} | {accept_encoding} | {size} | {encode} | {compress} |")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=30, help="Repetitions per combination (median is reported)")
+    args = parser.parse_args()
+    logging.disable(logging.INFO) # encode_listing logs every response
+    asyncio.run(run(args.runs))
@@ -0,0 +1,169 @@
+"""
+Compares Pyrogram's default FileStorage with BufferedFileStorage on a peer-heavy workload.
+
+No Telegram connection is needed: the script drives both storages the way the Pyrogram client
+does while dialogs are walked and message history is fetched (batches of update_peers calls,
+peer lookups by id and username, and the periodic session date update that commits to disk).
+
+Every measurement runs in a fresh Python process, after an untimed warm-up pass on a separate
+session file, and the storage order alternates between rounds so neither storage benefits from
+running second. open() and close() are timed separately from the steady-state calls. A loop-lag
+monitor also catches stalls from background work such as BufferedFileStorage's periodic flush.
+
+Usage (from the backend directory):
+    python benchmark_storage.py [--rounds 4] [--peers 20000] [--batch 100] [--lookups 50000]
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from pyrogram.storage import FileStorage
+
+from buffered_storage import BufferedFileStorage
+
+STORAGES = ["FileStorage", "BufferedFileStorage"]
+METRICS = [
+    ("open_ms", "open (ms)"),
+    ("write_s", "writes (s)"),
+    ("lookup_s", "lookups (s)"),
+    ("p99_ms", "p99 call (ms)"),
+    ("max_ms", "max call (ms)"),
+    ("loop_lag_ms", "max loop lag (ms)"),
+    ("close_ms", "close (ms)"),
+]
+
+def make_peer(peer_id: int):
+    # (id, access_hash, type, username, phone_number), as produced by Client.fetch_peers
+    if peer_id % 3 == 0:
+        return (-1000000000000 - peer_id, random.getrandbits(63), "channel", f"channel_{peer_id}", None)
+    return (peer_id, random.getrandbits(63), "user", f"user_{peer_id}", None)
+
+def make_storage(kind: str, name: str, workdir: Path, flush_interval: float):
+    if kind == "FileStorage":
+        return FileStorage(name, workdir)
+    return BufferedFileStorage(name, workdir, flush_interval=flush_interval)
+
+async def monitor_loop_lag(lags: list):
+    # Anything that blocks the event loop (including background flushes) shows up as a late wake-up.
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+async def run_workload(storage, peers, batch_size: int, lookups: int, commit_every: int) -> dict:
+    call_times = []
+
+    async def timed(coro):
+        started = time.perf_counter()
+        result = await coro
+        call_times.append(time.perf_counter() - started)
+        # Yield like a request handler would, so background tasks and the lag monitor get to run.
+        await asyncio.sleep(0)
+        return result
+
+    started = time.perf_counter()
+    await storage.open()
+    open_elapsed = time.perf_counter() - started
+
+    lags = []
+    monitor = asyncio.create_task(monitor_loop_lag(lags))
+
+    started = time.perf_counter()
+    for batch_number, i in enumerate(range(0, len(peers), batch_size)):
+        await timed(storage.update_peers(peers[i:i + batch_size]))
+        if batch_number % commit_every == 0:
+            # Pyrogram's accessors run `with conn:`, which commits the pending peer writes.
+            await timed(storage.date(int(time.time())))
+    write_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(lookups):
+        peer = random.choice(peers)
+        if random.random() < 0.8:
+            await timed(storage.get_peer_by_id(peer[0]))
+        else:
+            await timed(storage.get_peer_by_username(peer[3]))
+    lookup_elapsed = time.perf_counter() - started
+
+    monitor.cancel()
+    started = time.perf_counter()
+    await storage.save()
+    await storage.close()
+    close_elapsed = time.perf_counter() - started
+
+    call_times.sort()
+    return {
+        "open_ms": open_elapsed * 1000,
+        "write_s": write_elapsed,
+        "lookup_s": lookup_elapsed,
+        "p99_ms": call_times[int(len(call_times) * 0.99)] * 1000,
+        "max_ms": call_times[-1] * 1000,
+        "loop_lag_ms": max(lags, default=0.0) * 1000,
+        "close_ms": close_elapsed * 1000,
+    }
+
+async def run_worker(args) -> dict:
+    random.seed(0)
+    peers = [make_peer(i) for i in range(1, args.peers + 1)]
+    workdir_root = Path(args.workdir) if args.workdir else None
+    with tempfile.TemporaryDirectory(dir=workdir_root) as tmp_dir:
+        workdir = Path(tmp_dir)
+        # Untimed warm-up: pays the one-off costs (imports, first SQLite file creation) up front.
+        warmup = make_storage(args.worker, "warmup", workdir, args.flush_interval)
+        await run_workload(warmup, peers[:2000], args.batch, 2000, args.commit_every)
+        storage = make_storage(args.worker, "bench", workdir, args.flush_interval)
+        return await run_workload(storage, peers, args.batch, args.lookups, args.commit_every)
+
+def run_in_subprocess(kind: str, args) -> dict:
+    command = [
+        sys.executable, str(Path(__file__).resolve()), "--worker", kind,
+        "--peers", str(args.peers), "--batch", str(args.batch), "--lookups", str(args.lookups),
+        "--commit-every", str(args.commit_every), "--flush-interval", str(args.flush_interval),
+    ]
+    if args.workdir:
+        command += ["--workdir", args.workdir]
+    output = subprocess.run(command, check=True, capture_output=True, text=True, cwd=Path(__file__).parent).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=4, help="Fresh-process runs per storage (order alternates each round)")
+    parser.add_argument("--peers", type=int, default=20000, help="Number of distinct peers to store")
+    parser.add_argument("--batch", type=int, default=100, help="Peers per update_peers call (one dialogs/history page)")
+    parser.add_argument("--lookups", type=int, default=50000, help="Peer lookups after the writes")
+    parser.add_argument("--commit-every", type=int, default=1, help="Batches between session commits")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="BufferedFileStorage flush interval in seconds")
+    parser.add_argument("--workdir", help="Directory for the session files (default: system temp dir)")
+    parser.add_argument("--worker", choices=STORAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(run_worker(args))))
+        return
+
+    print(f"Workload: {args.peers} peers in batches of {args.batch}, {args.lookups} lookups, commit every {args.commit_every} batch(es), "
+          f"flush interval {args.flush_interval}s, {args.rounds} rounds")
+    results = {kind: [] for kind in STORAGES}
+    for round_number in range(args.rounds):
+        order = STORAGES if round_number % 2 == 0 else list(reversed(STORAGES))
+        for kind in order:
+            results[kind].append(run_in_subprocess(kind, args))
+
+    print("Median over rounds (min-max):")
+    print(f"{'metric':<20}" + "".join(f"{kind:>28}" for kind in STORAGES))
+    for key, label in METRICS:
+        cells = []
+        for kind in STORAGES:
+            values = [result[key] for result in results[kind]]
+            cells.append(f"{statistics.median(values):.3f} ({min(values):.3f}-{max(values):.3f})")
+        print(f"{label:<20}" + "".join(f"{cell:>28}" for cell in cells))
+
+if __name__ == "__main__":
+    main()
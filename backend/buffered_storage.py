@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import logging
+import os
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pyrogram.storage import FileStorage, MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+class BufferedFileStorage(MemoryStorage):
+    """
+    Pyrogram storage that serves peers and auth state from an in-memory SQLite database
+    and writes it back to the regular `.session` file in batches.
+
+    The session file is loaded (and migrated) once on open. Peer updates only mark the
+    database dirty; a background task flushes it every `flush_interval` seconds, changes to
+    auth state (auth key, DC, user, test mode, bot flag) are flushed right away, and close()
+    always flushes. Each flush writes a uniquely named temporary file, fsyncs it, atomically
+    replaces the session file and fsyncs the directory, so a crash or power loss leaves
+    either the previous or the new session on disk, never a torn one.
+    """
+
+    def __init__(self, name: str, workdir: Path, flush_interval: float = 30.0):
+        super().__init__(name)
+        self.database = workdir / (name + FileStorage.FILE_EXTENSION)
+        self.flush_interval = flush_interval
+        self.dirty = False
+        self.flush_count = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def open(self):
+        # Let FileStorage create or migrate the file, then copy it into memory in one pass.
+        file_storage = FileStorage(self.name, self.database.parent)
+        await file_storage.open()
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        file_storage.conn.backup(self.conn)
+        await file_storage.close()
+        logger.info(f"Loaded session {self.database} into memory (flush interval: {self.flush_interval}s)")
+        if self.flush_interval > 0:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                # Keep the data in memory and try again on the next tick.
+                logger.error(f"Periodic flush of session {self.database} failed: {e}", exc_info=True)
+
+    def _new_tmp_path(self) -> Path:
+        # A unique name per flush, so a write can never collide with another one's temp file.
+        fd, tmp_name = tempfile.mkstemp(prefix=self.database.name + ".", suffix=".tmp", dir=self.database.parent)
+        os.close(fd)
+        return Path(tmp_name)
+
+    def _replace_with(self, tmp_path: Path):
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.database)
+        # Persist the rename itself; without this a power loss can still bring back the old file.
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(self.database.parent, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _write_atomically(self, data: bytes):
+        tmp_path = self._new_tmp_path()
+        try:
+            tmp_path.write_bytes(data)
+            self._replace_with(tmp_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def _backup_atomically(self):
+        # Fallback for Python < 3.11, which lacks Connection.serialize.
+        tmp_path = self._new_tmp_path()
+        try:
+            disk_conn = sqlite3.connect(str(tmp_path))
+            try:
+                self.conn.backup(disk_conn)
+            finally:
+                disk_conn.close()
+            self._replace_with(tmp_path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    async def _write_snapshot(self):
+        if hasattr(self.conn, "serialize"):
+            write = asyncio.ensure_future(asyncio.to_thread(self._write_atomically, self.conn.serialize()))
+        else:
+            write = asyncio.ensure_future(asyncio.to_thread(self._backup_atomically))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            # The worker thread cannot be interrupted; wait for it so the lock is not released
+            # (and the file not touched by another flush) while it is still writing.
+            await asyncio.wait([write])
+            if write.exception():
+                logger.error(f"Flush of session {self.database} failed while cancelling: {write.exception()}")
+            raise
+
+    async def flush(self, force: bool = False):
+        """Writes the in-memory database to the session file if anything changed since the last flush."""
+        async with self._flush_lock:
+            if not self.dirty and not force:
+                return
+            # Commit any implicit transaction Pyrogram left open. Serializing is a memory copy on
+            # the loop thread; only the file write and fsync run in a worker thread.
+            self.conn.commit()
+            self.dirty = False
+            try:
+                await self._write_snapshot()
+            except BaseException:
+                # Includes cancellation: the data is still only guaranteed to be in memory.
+                self.dirty = True
+                raise
+            self.flush_count += 1
+            logger.debug(f"Flushed session {self.database}")
+
+    async def save(self):
+        await super().save()
+        await self.flush(force=True)
+
+    async def close(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            # Wait for the task to finish; an in-progress flush completes its write first.
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+            self._flush_task = None
+        try:
+            await self.flush()
+        finally:
+            await super().close()
+
+    async def delete(self):
+        if self.database.exists():
+            os.remove(self.database)
+
+    async def update_peers(self, peers: List[Tuple[int, int, str, str, str]]):
+        await super().update_peers(peers)
+        self.dirty = True
+
+    async def _set_auth_state(self, accessor, value):
+        result = await accessor(value)
+        if value is not object:
+            # Losing auth state on a crash would force a new login, so do not wait for the next tick.
+            self.dirty = True
+            await self.flush()
+        return result
+
+    async def dc_id(self, value: int = object):
+        return await self._set_auth_state(super().dc_id, value)
+
+    async def auth_key(self, value: bytes = object):
+        return await self._set_auth_state(super().auth_key, value)
+
+    async def user_id(self, value: int = object):
+        return await self._set_auth_state(super().user_id, value)
+
+    async def test_mode(self, value: bool = object):
+        return await self._set_auth_state(super().test_mode, value)
+
+    async def is_bot(self, value: bool = object):
+        return await self._set_auth_state(super().is_bot, value)
+
+    async def api_id(self, value: int = object):
+        result = await super().api_id(value)
+        if value is not object:
+            self.dirty = True
+        return result
+
+    async def date(self, value: int = object):
+        result = await super().date(value)
+        if value is not object:
+            self.dirty = True
+        return result
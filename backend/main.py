@@ -1,22 +1,42 @@
 import os
 import io
+import asyncio
+import gzip
+import json
+import time
 import logging
 from fastapi import FastAPI, HTTPException, Depends, status, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response
 from pyrogram.client import Client
 import pyrogram.enums # pyrogram.enums.MessageMediaType, pyrogram.enums.PollType
 from pyrogram.errors import (
     UserNotParticipant, PeerIdInvalid, AuthKeyUnregistered, ChannelPrivate, ChannelInvalid,
     InviteHashExpired, InviteHashInvalid, FloodWait
 )
-from pyrogram.types import Message as PyrogramMessage, ChatPrivileges, Chat, ChatPreview, Poll
+from pyrogram.types import Message as PyrogramMessage, ChatPrivileges, Chat, ChatPreview, Poll, ChatPhoto
 from dotenv import load_dotenv
+try: # Works both as `uvicorn backend.main:app` and `python main.py` from backend/
+    from .buffered_storage import BufferedFileStorage
+    from . import parquet_archive
+except ImportError:
+    from buffered_storage import BufferedFileStorage
+    import parquet_archive
 from pathlib import Path
-from typing import List, Optional, Any, AsyncGenerator, Union
+from typing import List, Optional, Any, AsyncGenerator, Union, Dict, Tuple
 from pydantic import BaseModel, Field
 import datetime # For message date conversion
 
+# Optional encoders for large listings; fall back to JSON / gzip when not installed.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -41,6 +61,31 @@ except ValueError:
     logger.error(error_msg)
     raise RuntimeError(error_msg)
 
+# Small profile/chat photos are cached on disk by their photo unique id, so a
+# photo is only downloaded again from Telegram when it actually changes.
+AVATAR_CACHE_DIR = Path(__file__).parent / "avatar_cache"
+AVATAR_CACHE_DIR.mkdir(exist_ok=True)
+
+# Listing responses smaller than this are sent uncompressed; larger than the
+# offload size are compressed in a worker thread to keep the event loop free.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_OFFLOAD_SIZE = int(os.getenv("COMPRESSION_OFFLOAD_SIZE", "65536"))
+# Listings with at least this many items are also serialized in a worker thread.
+ENCODE_OFFLOAD_ITEMS = int(os.getenv("ENCODE_OFFLOAD_ITEMS", "2000"))
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# "file" keeps Pyrogram's default SQLite session storage; "memory" serves peers and auth state
+# from memory and flushes them to the same session file every SESSION_FLUSH_INTERVAL seconds.
+SESSION_STORAGE = os.getenv("SESSION_STORAGE", "file").lower()
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "30"))
+
+# Per-chat, day-partitioned Parquet archives of message history (needs pyarrow).
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", str(Path(__file__).parent / "archive")))
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "5000"))
+
+# Number of most recent dialogs resolved in the background after connecting (0 disables warm-up).
+WARMUP_DIALOG_COUNT = int(os.getenv("WARMUP_DIALOG_COUNT", "50"))
+
 app = FastAPI(title="Telegram Channel Viewer API")
 
 origins = [
@@ -54,36 +99,121 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Before-Id"], # Archive pagination cursor, readable by browser clients
 )
 
 @app.on_event("startup")
 async def startup_event():
-    logger.info(f"Application startup: Initializing Pyrogram client for {PHONE_NUMBER}")
+    # Connecting (and warming caches) happens in the background so the server starts
+    # accepting /healthz and /readyz probes immediately; API routes answer 503 until connected.
+    logger.info(f"Application startup: Initializing Pyrogram client for {PHONE_NUMBER} in the background")
+    app.state.startup_status = StartupStatus(warmup_target=WARMUP_DIALOG_COUNT)
+    app.state.startup_task = asyncio.create_task(connect_and_warm_up())
+
+async def connect_and_warm_up():
+    startup_status: StartupStatus = app.state.startup_status
     try:
+        # One client (and session storage) is reused across connection attempts.
         client = await get_authenticated_client()
-        await client.connect()
-        app.state.pyrogram_client = client
-        logger.info(f"Pyrogram client connected and stored in app.state for {PHONE_NUMBER}")
-    except AuthKeyUnregistered:
-        logger.critical(f"CRITICAL: Authentication key unregistered for session {PHONE_NUMBER} during startup. The session might be revoked or expired.")
-        session_file_path = Path(__file__).parent / f"user_session_{PHONE_NUMBER.replace('+', '')}.session"
-        if session_file_path.exists():
+    except HTTPException as e:
+        # Missing session file or server configuration error: retrying will not help.
+        logger.critical(f"CRITICAL: Failed to initialize Pyrogram client for {PHONE_NUMBER} during startup: {e.detail}")
+        startup_status.connection_state = "failed"
+        startup_status.connection_error = str(e.detail)
+        return
+
+    retry_delay = 1
+    while True:
+        startup_status.connection_state = "connecting"
+        try:
             try:
-                session_file_path.unlink()
-                logger.info(f"Deleted potentially corrupt session file during startup: {session_file_path}")
-            except OSError as e:
-                logger.error(f"Error deleting session file {session_file_path} during startup: {e}")
-        raise RuntimeError(f"Pyrogram client authentication failed for {PHONE_NUMBER} at startup: AuthKeyUnregistered. Please re-run create_session.py.")
+                await client.connect()
+            except BaseException:
+                await release_client_storage(client)
+                raise
+            app.state.pyrogram_client = client
+            startup_status.connection_state = "connected"
+            startup_status.connection_error = None
+            logger.info(f"Pyrogram client connected and stored in app.state for {PHONE_NUMBER}")
+            break
+        except AuthKeyUnregistered:
+            logger.critical(f"CRITICAL: Authentication key unregistered for session {PHONE_NUMBER} during startup. The session might be revoked or expired.")
+            delete_session_file("during startup")
+            startup_status.connection_state = "failed"
+            startup_status.connection_error = "AuthKeyUnregistered. Please re-run create_session.py."
+            return
+        except FloodWait as e:
+            logger.critical(f"CRITICAL: FloodWait encountered for {PHONE_NUMBER} during startup: {e.value} seconds. Retrying once it expires.")
+            record_flood_wait(e)
+            startup_status.connection_error = f"FloodWait: {e.value} seconds"
+            await asyncio.sleep(int(e.value))
+        except Exception as e:
+            logger.critical(f"CRITICAL: Failed to initialize Pyrogram client for {PHONE_NUMBER} during startup: {e}. Retrying in {retry_delay}s.", exc_info=True)
+            startup_status.connection_error = str(e)
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, 60)
+
+    await warm_up_dialogs(client)
+
+async def warm_up_dialogs(client: Client):
+    """Walks the most recent dialogs once so their peers, avatars and access hashes are cached before traffic arrives."""
+    startup_status: StartupStatus = app.state.startup_status
+    if WARMUP_DIALOG_COUNT <= 0:
+        startup_status.warmup_state = "skipped"
+        return
+    startup_status.warmup_state = "running"
+    started = time.perf_counter()
+    try:
+        dialogs_iterable = client.get_dialogs(limit=WARMUP_DIALOG_COUNT)
+        if dialogs_iterable:
+            async for dialog in dialogs_iterable:
+                if dialog.chat:
+                    known_peer_ids.add(dialog.chat.id)
+                    remember_avatar(dialog.chat.id, getattr(dialog.chat, 'photo', None))
+                    startup_status.warmed_dialogs += 1
+        startup_status.warmup_state = "done"
+        logger.info(f"Warm-up finished: {startup_status.warmed_dialogs} dialogs in {time.perf_counter() - started:.2f}s for {PHONE_NUMBER}")
     except FloodWait as e:
-        logger.critical(f"CRITICAL: FloodWait encountered for {PHONE_NUMBER} during startup: {e.value} seconds. Application may not function correctly.")
-        raise RuntimeError(f"Pyrogram client connection failed for {PHONE_NUMBER} at startup due to FloodWait: {e.value} seconds. Try again later.")
+        # Serve traffic without the remaining warm-up rather than sleeping through the wait.
+        record_flood_wait(e)
+        startup_status.warmup_state = "failed"
+        logger.warning(f"Warm-up stopped by FloodWait of {e.value} seconds after {startup_status.warmed_dialogs} dialogs.")
+    except Exception as e:
+        startup_status.warmup_state = "failed"
+        logger.error(f"Warm-up failed after {startup_status.warmed_dialogs} dialogs: {e}", exc_info=True)
+
+async def release_client_storage(client: Client):
+    # A failed connect() may already have opened the session storage (with SESSION_STORAGE=memory
+    # that also starts its flush task); close it so the next attempt reopens it cleanly.
+    if getattr(client.storage, "conn", None) is None:
+        return
+    try:
+        await client.storage.close()
     except Exception as e:
-        logger.critical(f"CRITICAL: Failed to initialize Pyrogram client for {PHONE_NUMBER} during startup: {e}", exc_info=True)
-        raise RuntimeError(f"Pyrogram client initialization failed for {PHONE_NUMBER} at startup: {str(e)}")
+        logger.warning(f"Error closing session storage after a failed connection attempt: {e}")
+    client.storage.conn = None
+
+def delete_session_file(context: str):
+    assert PHONE_NUMBER is not None
+    session_file_path = Path(__file__).parent / f"user_session_{PHONE_NUMBER.replace('+', '')}.session"
+    if session_file_path.exists():
+        try:
+            session_file_path.unlink()
+            logger.info(f"Deleted potentially corrupt session file {context}: {session_file_path}")
+        except OSError as e:
+            logger.error(f"Error deleting session file {session_file_path} {context}: {e}")
+
+def record_flood_wait(e: FloodWait):
+    startup_status: Optional[StartupStatus] = getattr(app.state, "startup_status", None)
+    if startup_status:
+        startup_status.flood_wait_until = max(startup_status.flood_wait_until or 0, int(time.time()) + int(e.value))
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info(f"Application shutdown: Disconnecting Pyrogram client for {PHONE_NUMBER}")
+    startup_task: Optional[asyncio.Task] = getattr(app.state, "startup_task", None)
+    if startup_task and not startup_task.done():
+        startup_task.cancel()
     client: Optional[Client] = getattr(app.state, "pyrogram_client", None)
     if client and client.is_connected:
         await client.disconnect()
@@ -96,6 +226,7 @@ class DialogItem(BaseModel):
     id: int
     title: str
     type: str
+    avatar_url: Optional[str] = None # Relative URL of the cached small chat photo, if any
 
 class PollOptionItem(BaseModel): # Renamed from PollOption to avoid clash if any
     text: str
@@ -122,6 +253,7 @@ class MessageItem(BaseModel):
     mime_type: Optional[str] = None
     poll_data: Optional[PollDetails] = None
     is_outgoing: Optional[bool] = None # Added to indicate if the message is from the authenticated user
+    sender_avatar_url: Optional[str] = None # Relative URL of the sender's cached small photo, if any
 
 class SendMessageBody(BaseModel):
     chat_id: Union[int, str] = Field(..., description="ID or username of the chat to send the message to")
@@ -130,6 +262,26 @@ class SendMessageBody(BaseModel):
 class JoinChannelBody(BaseModel):
     invite_link: str = Field(..., description="The invite link or username (e.g., https://t.me/channelname, t.me/joinchat/XXXX, @channelusername)")
 
+class StartupStatus(BaseModel):
+    connection_state: str = "pending" # "pending", "connecting", "connected", "failed"
+    connection_error: Optional[str] = None
+    warmup_state: str = "pending" # "pending", "running", "done", "failed", "skipped"
+    warmed_dialogs: int = 0
+    warmup_target: int = 0
+    flood_wait_until: Optional[int] = None # Unix timestamp until which Telegram asked us to back off
+
+class HealthStatus(BaseModel):
+    ready: bool
+    status: StartupStatus
+    flood_wait_remaining: int = 0 # Seconds
+
+class ArchiveStatus(BaseModel):
+    chat_id: int
+    running: bool
+    last_message_id: int # Every message with an id <= this is archived
+    resume_from_id: Optional[int] = None # Set while a run is unfinished; the next run continues below this id
+    last_error: Optional[str] = None
+
 class ChannelInfo(BaseModel):
     id: int
     title: str
@@ -155,6 +307,9 @@ async def get_authenticated_client() -> Client:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Session for {PHONE_NUMBER} not found. Run session creation script.")
 
     client = Client(name=session_name, api_id=API_ID, api_hash=API_HASH, workdir=str(script_dir))
+    if SESSION_STORAGE == "memory":
+        client.storage = BufferedFileStorage(session_name, script_dir, flush_interval=SESSION_FLUSH_INTERVAL)
+        logger.info(f"Using in-memory session storage with a {SESSION_FLUSH_INTERVAL}s flush interval for {PHONE_NUMBER}")
     logger.info(f"Authenticated client instance created for {PHONE_NUMBER}")
     return client
 
@@ -171,6 +326,179 @@ async def get_current_client(request: Request) -> Client:
             detail="Telegram client is not ready or encountered an issue during startup. Please check server logs."
         )
     return client
+
+# Peers already resolved this process (by warm-up, dialog listing or a previous request),
+# for which the extra get_chat round-trip before fetching history can be skipped.
+known_peer_ids: set[int] = set()
+
+# --- Avatar cache helpers ---
+# peer_id -> (small_file_id, small_photo_unique_id), filled in as dialogs and messages are listed
+avatar_index: Dict[int, Tuple[str, str]] = {}
+# small_photo_unique_id -> in-flight download, so concurrent requests share one Telegram download
+avatar_downloads: Dict[str, "asyncio.Task[Path]"] = {}
+
+def avatar_cache_path(photo_unique_id: str) -> Path:
+    return AVATAR_CACHE_DIR / f"{photo_unique_id}.jpg"
+
+def remember_avatar(peer_id: int, photo: Optional[ChatPhoto]) -> Optional[str]:
+    """Records the current small photo of a peer and returns its avatar URL (None if the peer has no photo)."""
+    if not photo or not getattr(photo, 'small_file_id', None) or not getattr(photo, 'small_photo_unique_id', None):
+        return None
+    previous = avatar_index.get(peer_id)
+    avatar_index[peer_id] = (photo.small_file_id, photo.small_photo_unique_id)
+    if previous and previous[1] != photo.small_photo_unique_id:
+        # The photo changed; drop the stale file so the cache does not grow with old photos.
+        try:
+            avatar_cache_path(previous[1]).unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not delete stale avatar {previous[1]} for peer {peer_id}: {e}")
+    # The unique id doubles as a cache-busting version so browsers can cache the URL aggressively.
+    return f"/api/avatar/{peer_id}?v={photo.small_photo_unique_id}"
+
+def write_avatar_file(path: Path, data: bytes) -> None:
+    # Write to a temp file first so a crash never leaves a truncated image in the cache.
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+async def download_avatar(client: Client, small_file_id: str, photo_unique_id: str) -> Path:
+    path = avatar_cache_path(photo_unique_id)
+    downloaded_object = await client.download_media(message=small_file_id, in_memory=True)
+    if not isinstance(downloaded_object, io.BytesIO):
+        raise RuntimeError(f"Avatar download returned unexpected type: {type(downloaded_object)}")
+    await asyncio.to_thread(write_avatar_file, path, downloaded_object.getvalue())
+    logger.info(f"Cached avatar {photo_unique_id} at {path}")
+    return path
+
+async def get_cached_avatar(client: Client, small_file_id: str, photo_unique_id: str) -> Path:
+    path = avatar_cache_path(photo_unique_id)
+    if path.exists():
+        return path
+    task = avatar_downloads.get(photo_unique_id)
+    if task is None:
+        task = asyncio.create_task(download_avatar(client, small_file_id, photo_unique_id))
+        avatar_downloads[photo_unique_id] = task
+        task.add_done_callback(lambda _: avatar_downloads.pop(photo_unique_id, None))
+    return await asyncio.shield(task)
+
+# --- Listing response encoding helpers ---
+def parse_accept_header(header_value: Optional[str]) -> Dict[str, float]:
+    """Parses an Accept / Accept-Encoding header into {token: q}. Refused tokens (q=0) are kept so they can override wildcards."""
+    accepted: Dict[str, float] = {}
+    for part in (header_value or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[token] = q
+    return accepted
+
+def accept_q(accepted: Dict[str, float], token: str, *wildcards: str) -> float:
+    # A token's own entry (including an explicit q=0 refusal) takes precedence over wildcards.
+    if token in accepted:
+        return accepted[token]
+    return max((accepted[wildcard] for wildcard in wildcards if wildcard in accepted), default=0.0)
+
+def choose_content_encoding(accept_encoding: Optional[str], body_size: int) -> Optional[str]:
+    accepted = parse_accept_header(accept_encoding)
+    candidates = {enc: accept_q(accepted, enc, "*") for enc in ("br", "gzip") if enc != "br" or brotli is not None}
+    candidates = {enc: q for enc, q in candidates.items() if q > 0}
+    if not candidates:
+        return None
+    # identity stays acceptable unless refused by "identity;q=0" or by "*;q=0" without an identity entry.
+    identity_refused = ("identity" in accepted or "*" in accepted) and accept_q(accepted, "identity", "*") == 0
+    if body_size < COMPRESSION_MIN_SIZE and not identity_refused:
+        return None
+    # Prefer the client's highest q-value; brotli wins ties since it is listed first.
+    return max(candidates, key=lambda enc: candidates[enc])
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    if msgpack is None:
+        return False
+    accepted = parse_accept_header(accept)
+    msgpack_q = max(accept_q(accepted, media_type, "application/*", "*/*") for media_type in MSGPACK_MEDIA_TYPES)
+    json_q = accept_q(accepted, "application/json", "application/*", "*/*")
+    # JSON stays the default, so it wins ties (including a missing Accept header).
+    return msgpack_q > json_q
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def encode_items(items: List[Union[BaseModel, Dict[str, Any]]], use_msgpack: bool) -> bytes:
+    if use_msgpack:
+        # MessagePack carries bytes natively, so poll option data is not base64/text-inflated.
+        return msgpack.packb([item.model_dump() if isinstance(item, BaseModel) else item for item in items], use_bin_type=True)
+    # Pydantic's native serializer is several times faster than jsonable_encoder + json.dumps.
+    return b"[" + b",".join(
+        item.model_dump_json().encode("utf-8") if isinstance(item, BaseModel)
+        else json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for item in items
+    ) + b"]"
+
+async def encode_listing(request: Request, items: List[Union[BaseModel, Dict[str, Any]]]) -> Response:
+    """Serializes a listing of models or plain rows as JSON or MessagePack (per Accept) and compresses it (per Accept-Encoding)."""
+    started = time.perf_counter()
+    use_msgpack = prefers_msgpack(request.headers.get("accept"))
+    media_type = MSGPACK_MEDIA_TYPES[0] if use_msgpack else "application/json"
+    if len(items) >= ENCODE_OFFLOAD_ITEMS:
+        body = await asyncio.to_thread(encode_items, items, use_msgpack)
+    else:
+        body = encode_items(items, use_msgpack)
+    encode_ms = (time.perf_counter() - started) * 1000
+
+    headers = {"Vary": "Accept, Accept-Encoding", "X-Uncompressed-Length": str(len(body))}
+    server_timing = [f"encode;dur={encode_ms:.2f}"]
+    raw_size = len(body)
+    encoding = choose_content_encoding(request.headers.get("accept-encoding"), raw_size)
+    if encoding:
+        started = time.perf_counter()
+        if raw_size >= COMPRESSION_OFFLOAD_SIZE:
+            body = await asyncio.to_thread(compress_body, body, encoding)
+        else:
+            body = compress_body(body, encoding)
+        compress_ms = (time.perf_counter() - started) * 1000
+        headers["Content-Encoding"] = encoding
+        server_timing.append(f"compress;dur={compress_ms:.2f}")
+    headers["Server-Timing"] = ", ".join(server_timing)
+
+    logger.info(f"Encoded {len(items)} items for {request.url.path} as {media_type}: {raw_size} -> {len(body)} bytes ({encoding or 'identity'}; {headers['Server-Timing']})")
+    return Response(content=body, media_type=media_type, headers=headers)
+
+# --- Health Endpoints ---
+def current_health() -> HealthStatus:
+    startup_status: StartupStatus = getattr(app.state, "startup_status", None) or StartupStatus()
+    flood_wait_remaining = max(0, (startup_status.flood_wait_until or 0) - int(time.time()))
+    client: Optional[Client] = getattr(app.state, "pyrogram_client", None)
+    ready = (
+        client is not None and client.is_connected
+        and startup_status.warmup_state in ("done", "failed", "skipped")
+        and flood_wait_remaining == 0
+    )
+    return HealthStatus(ready=ready, status=startup_status, flood_wait_remaining=flood_wait_remaining)
+
+@app.get("/healthz", response_model=HealthStatus)
+async def healthz():
+    # Liveness: the process and event loop are responsive, whatever the Telegram connection state.
+    return current_health()
+
+@app.get("/readyz", response_model=HealthStatus)
+async def readyz():
+    # Readiness: only route traffic once connected, warmed up and not inside a FloodWait.
+    health = current_health()
+    if not health.ready:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=health.model_dump())
+    return health
+
 # --- Root Endpoint ---
 @app.get("/")
 async def root():
@@ -196,7 +524,7 @@ async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
 
 # --- API Endpoints ---
 @app.get("/api/dialogs", response_model=List[DialogItem])
-async def list_dialogs(client: Client = Depends(get_current_client)): # MODIFIED
+async def list_dialogs(request: Request, client: Client = Depends(get_current_client)): # MODIFIED
     logger.info(f"Received request for dialogs (using session for {PHONE_NUMBER})")
     dialog_items: List[DialogItem] = []
     try:
@@ -221,13 +549,19 @@ async def list_dialogs(client: Client = Depends(get_current_client)): # MODIFIED
                         title = current_chat.username
                 
                 if current_chat and hasattr(current_chat, 'id'):
+                    known_peer_ids.add(current_chat.id)
                     dialog_items.append(DialogItem(
                         id=current_chat.id,
                         title=title,
-                        type=dialog_type_str
+                        type=dialog_type_str,
+                        avatar_url=remember_avatar(current_chat.id, getattr(current_chat, 'photo', None))
                     ))
         logger.info(f"Successfully fetched {len(dialog_items)} dialogs for {PHONE_NUMBER}")
-        return dialog_items
+        return await encode_listing(request, dialog_items)
+    except FloodWait as e:
+        record_flood_wait(e)
+        logger.warning(f"FloodWait of {e.value} seconds while fetching dialogs for {PHONE_NUMBER}")
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=f"Telegram rate limit: retry in {e.value} seconds.", headers={"Retry-After": str(e.value)})
     except HTTPException: 
         raise
     except Exception as e: 
@@ -323,8 +657,81 @@ async def get_channel_info(channel_id_or_username: Union[int, str], client: Clie
         logger.error(f"Unexpected error fetching channel info for '{channel_id_or_username}': {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch channel info due to an unexpected error: {str(e)}")
 
+def build_message_item(msg: PyrogramMessage) -> MessageItem:
+    sender_str = "N/A"
+    sender_avatar_url: Optional[str] = None
+    if msg.from_user:
+        sender_str = msg.from_user.first_name or str(msg.from_user.id)
+        if msg.from_user.last_name:
+            sender_str += f" {msg.from_user.last_name}"
+        sender_avatar_url = remember_avatar(msg.from_user.id, getattr(msg.from_user, 'photo', None))
+    elif msg.sender_chat: 
+        sender_str = msg.sender_chat.title or str(msg.sender_chat.id)
+        sender_avatar_url = remember_avatar(msg.sender_chat.id, getattr(msg.sender_chat, 'photo', None))
+
+    media_type_str: Optional[str] = None
+    file_id_str: Optional[str] = None
+    file_name_str: Optional[str] = None
+    mime_type_str: Optional[str] = None
+    poll_data_obj: Optional[PollDetails] = None
+
+    if msg.media and isinstance(msg.media, pyrogram.enums.MessageMediaType):
+        media_type_str = msg.media.name.lower() 
+
+        if msg.photo:
+            file_id_str = msg.photo.file_id
+        elif msg.video:
+            file_id_str = msg.video.file_id
+            file_name_str = msg.video.file_name
+            mime_type_str = msg.video.mime_type
+        elif msg.audio:
+            file_id_str = msg.audio.file_id
+            file_name_str = msg.audio.file_name
+            mime_type_str = msg.audio.mime_type
+        elif msg.document:
+            file_id_str = msg.document.file_id
+            file_name_str = msg.document.file_name
+            mime_type_str = msg.document.mime_type
+        elif msg.poll and isinstance(msg.poll, Poll): 
+            pyro_poll = msg.poll
+            poll_type_name = "unknown"
+            if pyro_poll.type and hasattr(pyro_poll.type, 'name'):
+                 poll_type_name = pyro_poll.type.name.lower()
+
+            poll_data_obj = PollDetails(
+                question=pyro_poll.question,
+                options=[PollOptionItem(text=opt.text, data=opt.data) for opt in pyro_poll.options],
+                total_voters=getattr(pyro_poll, 'total_voters', None),
+                is_closed=pyro_poll.is_closed,
+                is_anonymous=pyro_poll.is_anonymous,
+                type=poll_type_name,
+                allows_multiple_answers=pyro_poll.allows_multiple_answers,
+                quiz_correct_option_id=pyro_poll.correct_option_id
+            )
+
+    msg_date_timestamp = 0
+    if msg.date and isinstance(msg.date, datetime.datetime):
+        msg_date_timestamp = int(msg.date.timestamp())
+
+    is_outgoing_msg = getattr(msg, 'outgoing', None) 
+
+    return MessageItem(
+        id=msg.id,
+        text=msg.text or msg.caption, 
+        sender=sender_str,
+        date=msg_date_timestamp,
+        media_type=media_type_str,
+        file_id=file_id_str,
+        file_name=file_name_str,
+        mime_type=mime_type_str,
+        poll_data=poll_data_obj,
+        is_outgoing=is_outgoing_msg,
+        sender_avatar_url=sender_avatar_url
+    )
+
 @app.get("/api/channels/{channel_id_or_username}/messages", response_model=List[MessageItem])
 async def get_channel_messages(
+    request: Request,
     channel_id_or_username: Union[int, str],
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0),  # Renamed from offset_message_id
@@ -360,8 +767,12 @@ async def get_channel_messages(
             current_numeric_id = int(peer_to_process) 
             logger.info(f"Processing numeric ID: {current_numeric_id}")
             try:
-                await client.get_chat(current_numeric_id)
-                logger.info(f"Successfully 'met' peer {current_numeric_id} directly.")
+                if current_numeric_id in known_peer_ids:
+                    logger.info(f"Peer {current_numeric_id} already resolved; skipping get_chat.")
+                else:
+                    await client.get_chat(current_numeric_id)
+                    known_peer_ids.add(current_numeric_id)
+                    logger.info(f"Successfully 'met' peer {current_numeric_id} directly.")
                 resolved_peer_for_history = current_numeric_id
             except PeerIdInvalid:
                 logger.info(f"Direct peer resolution failed for {current_numeric_id}, trying to find in dialogs...")
@@ -371,6 +782,7 @@ async def get_channel_messages(
                     async for dialog in dialogs_generator_inner:
                         if dialog.chat and dialog.chat.id == current_numeric_id:
                             resolved_peer_for_history = dialog.chat.id
+                            known_peer_ids.add(current_numeric_id)
                             peer_found_in_dialogs = True
                             logger.info(f"Found peer {current_numeric_id} in dialogs.")
                             break
@@ -412,75 +824,13 @@ async def get_channel_messages(
         if messages_generator:
             async for msg in messages_generator:
                 if not isinstance(msg, PyrogramMessage): continue
-
-                sender_str = "N/A"
-                if msg.from_user:
-                    sender_str = msg.from_user.first_name or str(msg.from_user.id)
-                    if msg.from_user.last_name:
-                        sender_str += f" {msg.from_user.last_name}"
-                elif msg.sender_chat: 
-                    sender_str = msg.sender_chat.title or str(msg.sender_chat.id)
-                
-                media_type_str: Optional[str] = None
-                file_id_str: Optional[str] = None
-                file_name_str: Optional[str] = None
-                mime_type_str: Optional[str] = None
-                poll_data_obj: Optional[PollDetails] = None
-
-                if msg.media and isinstance(msg.media, pyrogram.enums.MessageMediaType):
-                    media_type_str = msg.media.name.lower() 
-
-                    if msg.photo:
-                        file_id_str = msg.photo.file_id
-                    elif msg.video:
-                        file_id_str = msg.video.file_id
-                        file_name_str = msg.video.file_name
-                        mime_type_str = msg.video.mime_type
-                    elif msg.audio:
-                        file_id_str = msg.audio.file_id
-                        file_name_str = msg.audio.file_name
-                        mime_type_str = msg.audio.mime_type
-                    elif msg.document:
-                        file_id_str = msg.document.file_id
-                        file_name_str = msg.document.file_name
-                        mime_type_str = msg.document.mime_type
-                    elif msg.poll and isinstance(msg.poll, Poll): 
-                        pyro_poll = msg.poll
-                        poll_type_name = "unknown"
-                        if pyro_poll.type and hasattr(pyro_poll.type, 'name'):
-                             poll_type_name = pyro_poll.type.name.lower()
-
-                        poll_data_obj = PollDetails(
-                            question=pyro_poll.question,
-                            options=[PollOptionItem(text=opt.text, data=opt.data) for opt in pyro_poll.options],
-                            total_voters=getattr(pyro_poll, 'total_voters', None),
-                            is_closed=pyro_poll.is_closed,
-                            is_anonymous=pyro_poll.is_anonymous,
-                            type=poll_type_name,
-                            allows_multiple_answers=pyro_poll.allows_multiple_answers,
-                            quiz_correct_option_id=pyro_poll.correct_option_id
-                        )
-                
-                msg_date_timestamp = 0
-                if msg.date and isinstance(msg.date, datetime.datetime):
-                    msg_date_timestamp = int(msg.date.timestamp())
-                
-                is_outgoing_msg = getattr(msg, 'outgoing', None) 
-
-                messages_data.append(MessageItem(
-                    id=msg.id,
-                    text=msg.text or msg.caption, 
-                    sender=sender_str,
-                    date=msg_date_timestamp,
-                    media_type=media_type_str,
-                    file_id=file_id_str,
-                    file_name=file_name_str,
-                    mime_type=mime_type_str,
-                    poll_data=poll_data_obj,
-                    is_outgoing=is_outgoing_msg
-                ))
+                messages_data.append(build_message_item(msg))
         logger.info(f"Fetched {len(messages_data)} messages from {channel_id_or_username} for {PHONE_NUMBER}")
-        return messages_data
+        return await encode_listing(request, messages_data)
+    except FloodWait as e:
+        record_flood_wait(e)
+        logger.warning(f"FloodWait of {e.value} seconds while fetching messages from {channel_id_or_username}")
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=f"Telegram rate limit: retry in {e.value} seconds.", headers={"Retry-After": str(e.value)})
     except (ChannelPrivate, ChannelInvalid, PeerIdInvalid, UserNotParticipant):
         logger.warning(f"Channel not accessible or invalid for messages: {channel_id_or_username}", exc_info=False)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Channel not found, not accessible, or you are not a participant.")
@@ -653,6 +1003,165 @@ async def get_media_file_endpoint(
         logger.error(f"Error downloading media (chat: {chat_id}, msg: {message_id}, file: {file_id_or_type}): {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to download media: {str(e)}")
 
+@app.get("/api/avatar/{peer_id}")
+async def get_avatar(
+    peer_id: int,
+    v: Optional[str] = Query(None, description="Photo unique id from avatar_url; a mismatch forces a refresh of the peer's photo info"),
+    client: Client = Depends(get_current_client)
+):
+    logger.info(f"Request for avatar of peer {peer_id} (v={v}, session: {PHONE_NUMBER})")
+    try:
+        entry = avatar_index.get(peer_id)
+        if entry is None or (v is not None and v != entry[1]):
+            chat_obj = await client.get_chat(peer_id)
+            if not remember_avatar(peer_id, getattr(chat_obj, 'photo', None)):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Peer {peer_id} has no photo.")
+            entry = avatar_index[peer_id]
+
+        small_file_id, photo_unique_id = entry
+        avatar_path = await get_cached_avatar(client, small_file_id, photo_unique_id)
+        return FileResponse(
+            avatar_path,
+            media_type="image/jpeg",
+            headers={"Cache-Control": "public, max-age=604800, immutable" if v == photo_unique_id else "no-cache"}
+        )
+    except (ChannelPrivate, ChannelInvalid, PeerIdInvalid, UserNotParticipant) as e:
+        logger.warning(f"Avatar: peer {peer_id} not accessible: {type(e).__name__} - {e}", exc_info=False)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Peer {peer_id} not found or not accessible.")
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching avatar for peer {peer_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to fetch avatar: {str(e)}")
+
+# --- Parquet archive ---
+# chat_id -> running archive task; one run per chat at a time
+archive_tasks: Dict[int, "asyncio.Task[None]"] = {}
+archive_errors: Dict[int, str] = {}
+
+def get_archive() -> "parquet_archive.ParquetArchive":
+    if parquet_archive.pa is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Parquet archive requires pyarrow on the server.")
+    return parquet_archive.ParquetArchive(ARCHIVE_DIR)
+
+def archive_row(item: MessageItem) -> Dict[str, Any]:
+    row = item.model_dump(include=set(parquet_archive.MESSAGE_SCHEMA.names))
+    row["poll_question"] = item.poll_data.question if item.poll_data else None
+    return row
+
+def archive_status(archive: "parquet_archive.ParquetArchive", chat_id: int) -> ArchiveStatus:
+    state = archive.load_state(chat_id)
+    task = archive_tasks.get(chat_id)
+    return ArchiveStatus(
+        chat_id=chat_id,
+        running=task is not None and not task.done(),
+        last_message_id=state["last_message_id"],
+        resume_from_id=state["run"]["resume_from_id"] if state["run"] else None,
+        last_error=archive_errors.get(chat_id)
+    )
+
+async def archive_chat_history(client: Client, archive: "parquet_archive.ParquetArchive", chat_id: int, max_messages: Optional[int]):
+    """Archives messages newer than the last archived id, newest first, one chunk (and state update) at a time."""
+    state = await asyncio.to_thread(archive.load_state, chat_id)
+    last_message_id = state["last_message_id"]
+    run = state["run"] or {"target_id": None, "resume_from_id": 0}
+    if chat_id not in known_peer_ids:
+        await client.get_chat(chat_id)
+        known_peer_ids.add(chat_id)
+
+    logger.info(f"Archiving chat {chat_id}: messages {last_message_id} < id < {run['resume_from_id'] or 'newest'}")
+    archived = 0
+    reached_watermark = True
+    chunk: List[Dict[str, Any]] = []
+
+    async def flush_chunk():
+        # Parts are written before the state moves, so a crash re-fetches the chunk at worst.
+        await asyncio.to_thread(archive.write_chunk, chat_id, chunk)
+        run["resume_from_id"] = chunk[-1]["id"]
+        state["run"] = run
+        await asyncio.to_thread(archive.save_state, chat_id, state)
+        chunk.clear()
+
+    async for msg in client.get_chat_history(chat_id, offset_id=run["resume_from_id"]):
+        if not isinstance(msg, PyrogramMessage):
+            continue
+        if msg.id <= last_message_id:
+            break
+        if run["target_id"] is None:
+            run["target_id"] = msg.id
+        if max_messages is not None and archived >= max_messages:
+            reached_watermark = False
+            break
+        chunk.append(archive_row(build_message_item(msg)))
+        archived += 1
+        if len(chunk) >= ARCHIVE_CHUNK_SIZE:
+            await flush_chunk()
+
+    if chunk:
+        await flush_chunk()
+    if reached_watermark:
+        if run["target_id"] is not None:
+            state["last_message_id"] = run["target_id"]
+        state["run"] = None
+        await asyncio.to_thread(archive.save_state, chat_id, state)
+    logger.info(f"Archived {archived} messages from chat {chat_id} ({'complete' if reached_watermark else 'partial, will resume'})")
+
+async def run_archive_job(client: Client, archive: "parquet_archive.ParquetArchive", chat_id: int, max_messages: Optional[int]):
+    archive_errors.pop(chat_id, None)
+    try:
+        await archive_chat_history(client, archive, chat_id, max_messages)
+    except FloodWait as e:
+        # Reported only in this chat's archive status: a background job being throttled must not
+        # make /readyz fail while the connection and the user-facing endpoints are fine.
+        archive_errors[chat_id] = f"FloodWait: retry in {e.value} seconds"
+        logger.warning(f"Archive of chat {chat_id} stopped by FloodWait of {e.value} seconds; it will resume on the next run.")
+    except Exception as e:
+        archive_errors[chat_id] = str(e)
+        logger.error(f"Archive of chat {chat_id} failed: {e}", exc_info=True)
+
+@app.post("/api/archive/{chat_id}", response_model=ArchiveStatus, status_code=status.HTTP_202_ACCEPTED)
+async def start_archive(
+    chat_id: int,
+    max_messages: Optional[int] = Query(None, ge=1, description="Stop after this many messages; the next run resumes from there"),
+    client: Client = Depends(get_current_client)
+):
+    logger.info(f"Request to archive chat {chat_id} (max_messages={max_messages}, session: {PHONE_NUMBER})")
+    archive = get_archive()
+    task = archive_tasks.get(chat_id)
+    if task is None or task.done():
+        archive_tasks[chat_id] = asyncio.create_task(run_archive_job(client, archive, chat_id, max_messages))
+    return archive_status(archive, chat_id)
+
+@app.get("/api/archive/{chat_id}/status", response_model=ArchiveStatus)
+async def get_archive_status(chat_id: int):
+    return archive_status(get_archive(), chat_id)
+
+@app.get("/api/archive/{chat_id}/messages")
+async def read_archived_messages(
+    request: Request,
+    chat_id: int,
+    columns: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,date,sender"),
+    start_date: Optional[datetime.date] = Query(None, description="First day (UTC) to include, YYYY-MM-DD"),
+    end_date: Optional[datetime.date] = Query(None, description="Last day (UTC) to include, YYYY-MM-DD"),
+    before_id: Optional[int] = Query(None, ge=1, description="Only return messages with a smaller id; pass X-Next-Before-Id from the previous page"),
+    limit: int = Query(1000, ge=1, le=10000, description="Page size; follow X-Next-Before-Id for more")
+):
+    logger.info(f"Request for archived messages of chat {chat_id}: columns={columns}, {start_date}..{end_date}, before_id {before_id}, limit {limit}")
+    archive = get_archive()
+    column_list = [name.strip() for name in columns.split(",") if name.strip()] if columns else None
+    try:
+        rows, next_before_id = await asyncio.to_thread(archive.read_messages, chat_id, column_list, start_date, end_date, limit, before_id)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error reading archive of chat {chat_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to read archive: {str(e)}")
+    response = await encode_listing(request, rows)
+    if next_before_id is not None:
+        # Keyset cursor for the next (older) page; absent once the range is exhausted.
+        response.headers["X-Next-Before-Id"] = str(next_before_id)
+    return response
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting Uvicorn server directly from main.py (for debugging)")
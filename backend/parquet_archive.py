@@ -0,0 +1,205 @@
+import datetime
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+# Low-cardinality string columns stored with dictionary encoding.
+DICTIONARY_COLUMNS = ["sender", "media_type"]
+STATE_FILE_NAME = "_state.json"
+# Existing parts of a day are merged with new rows until a part reaches this many rows.
+MAX_PART_ROWS = 100000
+
+if pa is not None:
+    MESSAGE_SCHEMA = pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.timestamp("s", tz="UTC")),
+        ("sender", pa.dictionary(pa.int32(), pa.string())),
+        ("media_type", pa.dictionary(pa.int32(), pa.string())),
+        ("text", pa.string()),
+        ("file_id", pa.string()),
+        ("file_name", pa.string()),
+        ("mime_type", pa.string()),
+        ("poll_question", pa.string()),
+        ("is_outgoing", pa.bool_()),
+    ])
+
+def deduplicate_ids(table: "pa.Table") -> "pa.Table":
+    """Keeps the first row for each id (row order is not preserved)."""
+    if table.num_rows == pc.count_distinct(table["id"]).as_py():
+        return table
+    first_rows = table.append_column("_row", pa.array(range(table.num_rows))).group_by("id").aggregate([("_row", "min")])
+    return table.take(first_rows["_row_min"])
+
+class ParquetArchive:
+    """
+    Per-chat, date-partitioned Parquet archive of message history.
+
+    Layout: <root>/chat_<chat_id>/day=YYYY-MM-DD/part-<max_id>-<min_id>.parquet, plus a
+    _state.json per chat. Telegram returns history newest first, so an archiving run walks
+    down from the newest message to the last archived id in chunks. Each chunk is merged into
+    the day's existing parts (up to MAX_PART_ROWS rows per part) instead of adding a new small
+    part, so a day normally stays a single file. The state records both the archived watermark
+    and how far an unfinished run got, so an interrupted run resumes where it stopped instead
+    of writing duplicate rows.
+    """
+
+    def __init__(self, root: Path):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the Parquet archive. Install it with `pip install pyarrow`.")
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def chat_dir(self, chat_id: int) -> Path:
+        return self.root / f"chat_{chat_id}"
+
+    def load_state(self, chat_id: int) -> Dict[str, Any]:
+        """Returns {"last_message_id": int, "run": {"target_id": int, "resume_from_id": int} | None}."""
+        state_path = self.chat_dir(chat_id) / STATE_FILE_NAME
+        if not state_path.exists():
+            return {"last_message_id": 0, "run": None}
+        return json.loads(state_path.read_text())
+
+    def save_state(self, chat_id: int, state: Dict[str, Any]):
+        chat_dir = self.chat_dir(chat_id)
+        chat_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = chat_dir / f".{STATE_FILE_NAME}.tmp"
+        tmp_path.write_text(json.dumps(state))
+        os.replace(tmp_path, chat_dir / STATE_FILE_NAME)
+
+    def write_chunk(self, chat_id: int, rows: List[Dict[str, Any]]) -> int:
+        """
+        Merges one chunk of message rows (MESSAGE_SCHEMA fields, date as a Unix timestamp) into
+        per-day parts. Returns the number of files written.
+
+        The new rows are combined with the day's parts that still have room (smallest first,
+        up to MAX_PART_ROWS rows in total) and written as one new part before the merged parts
+        are removed. A reader that lists the day in between sees the same rows twice, which
+        read_messages drops by id; a crash in between leaves duplicates that readers drop the
+        same way and that the day's next merge removes.
+        """
+        rows_by_day: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            day = datetime.datetime.fromtimestamp(row["date"], tz=datetime.timezone.utc).strftime("%Y-%m-%d")
+            rows_by_day.setdefault(day, []).append(row)
+
+        for day, day_rows in rows_by_day.items():
+            day_dir = self.chat_dir(chat_id) / f"day={day}"
+            day_dir.mkdir(parents=True, exist_ok=True)
+            tables = [pa.Table.from_pylist(day_rows, schema=MESSAGE_SCHEMA)]
+            merged_paths = []
+            total_rows = tables[0].num_rows
+            existing = sorted((pq.read_metadata(path).num_rows, path) for path in day_dir.glob("part-*.parquet"))
+            for num_rows, part_path in existing:
+                if total_rows + num_rows > MAX_PART_ROWS:
+                    break
+                # Parquet returns second timestamps as milliseconds; cast back so the tables concatenate.
+                tables.append(pq.read_table(part_path).cast(MESSAGE_SCHEMA))
+                merged_paths.append(part_path)
+                total_rows += num_rows
+            # New rows come first, so they win over an older copy of the same message.
+            table = deduplicate_ids(pa.concat_tables(tables)).sort_by([("id", "descending")])
+            file_name = f"part-{table['id'][0].as_py()}-{table['id'][-1].as_py()}.parquet"
+            # Temp files do not match part-*.parquet, so readers never see a half-written part.
+            tmp_path = day_dir / f".{file_name}.tmp"
+            pq.write_table(table, tmp_path, compression="zstd", use_dictionary=DICTIONARY_COLUMNS)
+            os.replace(tmp_path, day_dir / file_name)
+            for part_path in merged_paths:
+                if part_path.name != file_name:
+                    part_path.unlink(missing_ok=True)
+        return len(rows_by_day)
+
+    def list_parts(
+        self,
+        chat_id: int,
+        start_day: Optional[datetime.date] = None,
+        end_day: Optional[datetime.date] = None,
+        before_id: Optional[int] = None,
+    ) -> List[Tuple[int, int, Path]]:
+        """
+        Returns (max_id, min_id, path) for the parts inside [start_day, end_day] that can hold ids
+        below before_id, newest first. Pruning uses only directory and file names, no file is opened.
+        """
+        chat_dir = self.chat_dir(chat_id)
+        if not chat_dir.exists():
+            return []
+        parts: List[Tuple[int, int, Path]] = []
+        for day_dir in chat_dir.glob("day=*"):
+            day = day_dir.name[len("day="):]
+            if (start_day and day < start_day.isoformat()) or (end_day and day > end_day.isoformat()):
+                continue
+            for part_path in day_dir.glob("part-*.parquet"):
+                max_id, min_id = (int(value) for value in part_path.stem[len("part-"):].split("-"))
+                if before_id is not None and min_id >= before_id:
+                    continue
+                parts.append((max_id, min_id, part_path))
+        parts.sort(key=lambda part: part[0], reverse=True)
+        return parts
+
+    def read_messages(
+        self,
+        chat_id: int,
+        columns: Optional[List[str]] = None,
+        start_day: Optional[datetime.date] = None,
+        end_day: Optional[datetime.date] = None,
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """
+        Reads archived messages newest first, only decoding the requested columns.
+
+        Parts are pruned by day and id range from their names and read newest first; the scan
+        stops as soon as `limit` rows are collected and no remaining part can hold a newer id.
+        `before_id` is pushed down as an `id < before_id` filter for keyset pagination. Rows
+        seen twice while a day's parts are being merged are returned once. Returns
+        the rows and the before_id for the next page (None once the range is exhausted).
+        Raises ValueError for unknown column names.
+        """
+        columns = columns or MESSAGE_SCHEMA.names
+        unknown = [name for name in columns if name not in MESSAGE_SCHEMA.names]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}. Available: {', '.join(MESSAGE_SCHEMA.names)}")
+
+        # "id" is always read so results can be ordered and paginated; it is dropped again if not requested.
+        scan_columns = columns if "id" in columns else ["id", *columns]
+        id_filter = (pc.field("id") < before_id) if before_id is not None else None
+        tables = []
+        collected = 0
+        cutoff_id: Optional[int] = None # Smallest id that can still make the page once `limit` rows are collected
+        for max_id, _, part_path in self.list_parts(chat_id, start_day, end_day, before_id):
+            if cutoff_id is not None and max_id < cutoff_id:
+                break
+            table = pq.read_table(part_path, columns=scan_columns, filters=id_filter)
+            if table.num_rows == 0:
+                continue
+            tables.append(table)
+            collected += table.num_rows
+            if limit is not None and collected >= limit:
+                # Distinct ids only: a part being merged can briefly be listed next to its replacement.
+                collected_ids = pc.unique(pa.concat_arrays([chunk for t in tables for chunk in t["id"].chunks]))
+                if len(collected_ids) >= limit:
+                    descending = pc.array_sort_indices(collected_ids, order="descending")
+                    cutoff_id = collected_ids[descending[limit - 1].as_py()].as_py()
+
+        if not tables:
+            return [], None
+        table = deduplicate_ids(pa.concat_tables(tables)).sort_by([("id", "descending")])
+        if limit is not None:
+            table = table.slice(0, limit)
+        next_before_id = table["id"][-1].as_py() if limit is not None and table.num_rows == limit else None
+        table = table.select(columns)
+        if "date" in columns:
+            # Parquet stores second timestamps as milliseconds; return the same Unix seconds as MessageItem.date.
+            unix_seconds = table["date"].cast(MESSAGE_SCHEMA.field("date").type).cast(pa.int64())
+            table = table.set_column(columns.index("date"), "date", unix_seconds)
+        return table.to_pylist(), next_before_id